@@ -3,33 +3,95 @@ import sqlite3
 import os
 import sys
 import argparse
+import gzip
+import json
+import multiprocessing
+import re
+import shutil
 import time
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from tqdm import tqdm
 
+# Tile writes are I/O bound, so use more threads than cores
+DEFAULT_WORKERS = (os.cpu_count() or 1) * 4
+# Number of rows pulled from SQLite per fetchmany() call, and handed to a
+# worker thread as one task
+FETCH_BATCH_SIZE = 64
+# Flags for creating tile files with a bare file descriptor. O_EXCL rather
+# than O_TRUNC: an existing file may be a hard link into DEDUP_DIR from an
+# earlier run, and writing through it would change every tile sharing it.
+TILE_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+# Directory, inside the output directory, holding one copy of each distinct
+# tile of a deduplicated MBTiles; the tile tree hard-links to these files
+DEDUP_DIR = '.dedup'
+# Single tile lookup, reused by --serve, --pack and the --no-extract viewer's
+# JavaScript. sqlite3 keeps the prepared statement cached per connection as
+# long as the SQL text is identical.
+SELECT_TILE = "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?"
+# Deepest zoom level --serve will look up
+MAX_ZOOM = 30
+# Port used by --serve when none is given
+DEFAULT_PORT = 8080
+# Content types for the tile formats the MBTiles spec allows
+TILE_CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'pbf': 'application/x-protobuf',
+}
+
+def connect_mbtiles(db_file):
+    """
+    Opens an MBTiles file read-only, tuned for one large sequential scan.
+    """
+    # immutable=1 promises SQLite the file won't change underneath us, so it
+    # skips file locking and change detection altogether. That also keeps
+    # parallel worker processes from contending on the same file.
+    db_uri = f"file:{urllib.request.pathname2url(os.path.abspath(db_file))}?mode=ro&immutable=1"
+    conn = sqlite3.connect(db_uri, uri=True)
+    conn.execute("PRAGMA query_only=1")
+    # Map the database into memory and keep plenty of pages cached. The file is
+    # only read, so the journal/synchronous settings would have no effect.
+    conn.execute("PRAGMA mmap_size=1073741824")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
 def get_tile_format(cur):
     """
     Queries the metadata table to determine the tile image format.
     Defaults to 'png' if not found.
     """
     try:
-        cur.execute("SELECT value FROM metadata WHERE name = 'format'")
-        result = cur.fetchone()
+        result = cur.execute("SELECT value FROM metadata WHERE name = 'format'").fetchone()
         if result:
             return result[0]
     except sqlite3.OperationalError:
         print("Warning: Could not read 'format' from metadata table.")
     return 'png' # Default to png if not specified
 
-# MODIFIED: This function now uses the user-provided static HTML as a template.
-def create_static_html_viewer(output_dir, tile_format):
+def get_tile_count(cur):
     """
-    Creates a static index.html file in the main directory.
+    Returns the number of tiles for the progress bar, taken from the
+    'tiles_count' metadata entry when the file has one, since counting a large
+    tiles table (or view) means scanning all of it. The metadata can be stale,
+    so don't rely on it for anything but progress.
     """
-    # Get the name of the tile folder to use in the HTML path
-    tile_folder_name = os.path.basename(output_dir)
+    try:
+        result = cur.execute("SELECT value FROM metadata WHERE name = 'tiles_count'").fetchone()
+        if result and str(result[0]).isdigit() and int(result[0]) > 0:
+            return int(result[0])
+    except sqlite3.OperationalError:
+        pass # No metadata table, count the rows instead
+    return cur.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
 
-    # User-provided HTML, with the tile path made dynamic
-    html_content = f"""
+# User-provided HTML, with the script tags and tile layer left as slots
+HTML_TEMPLATE = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -60,74 +122,396 @@ def create_static_html_viewer(output_dir, tile_format):
 
 <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"
      integrity="sha256-20nQCchB9co0qIjJZRGuk2/Z9VM+kNiyxNV1lvTlZBo="
-     crossorigin=""></script>
+     crossorigin=""></script>{extra_scripts}
 
 <script>
     // Initialize the map and set its view
     const map = L.map('map').setView([25.13, 88.85], 12); // Centered view
 
-    // Add the tile layer to the map, pointing to the local folder
-    L.tileLayer('{tile_folder_name}/{{z}}/{{x}}/{{y}}.{tile_format}', {{
-        maxZoom: 18,
-        minZoom: 0,
-        attribution: 'Map data &copy; OpenStreetMap contributors',
-        tms: false // Set to false because our script output is XYZ
-    }}).addTo(map);
+    // Add the tile layer to the map, pointing to the extracted tiles
+    {tile_layer}.addTo(map);
 
 </script>
 
 </body>
 </html>
-"""
-    # MODIFIED: Create index.html in the current working directory
-    html_path = 'index.html'
+""".strip()
+# Options shared by every kind of tile layer the viewer can use
+LAYER_OPTIONS = """{{
+        maxZoom: 18,
+        minZoom: 0,
+        attribution: 'Map data &copy; OpenStreetMap contributors'
+    }}"""
+TILE_LAYER_TEMPLATE = "L.tileLayer('{tile_url}', L.extend(" + LAYER_OPTIONS + ", {{ tms: {tms} }}))"
+PMTILES_SCRIPTS = '\n<script src="https://unpkg.com/pmtiles@3.2.1/dist/pmtiles.js"></script>'
+PMTILES_LAYER_TEMPLATE = "pmtiles.leafletRasterLayer(new pmtiles.PMTiles('{tile_url}'), " + LAYER_OPTIONS + ")"
+# Leaflet layer that loads the whole MBTiles file into the browser with sql.js
+# and queries each tile from it, so nothing has to be extracted
+MBTILES_SCRIPTS = """
+<script src="https://cdnjs.cloudflare.com/ajax/libs/sql.js/1.10.3/sql-wasm.js"></script>
+<script>
+    const MBTilesLayer = L.GridLayer.extend({
+        initialize: function (url, options) {
+            L.GridLayer.prototype.initialize.call(this, options);
+            this._db = Promise.all([
+                initSqlJs({ locateFile: file => `https://cdnjs.cloudflare.com/ajax/libs/sql.js/1.10.3/${file}` }),
+                fetch(url).then(response => response.arrayBuffer())
+            ]).then(([SQL, buffer]) => new SQL.Database(new Uint8Array(buffer)));
+        },
+
+        createTile: function (coords, done) {
+            const tile = document.createElement('img');
+            this._db.then(db => {
+                // MBTiles rows are TMS, Leaflet asks for XYZ
+                const result = db.exec(
+                    """ + json.dumps(SELECT_TILE) + """,
+                    [coords.z, coords.x, (1 << coords.z) - 1 - coords.y]);
+                if (!result.length) {
+                    done(null, tile);
+                    return;
+                }
+                const url = URL.createObjectURL(new Blob([result[0].values[0][0]], { type: this.options.contentType }));
+                tile.onload = () => {
+                    URL.revokeObjectURL(url);
+                    done(null, tile);
+                };
+                tile.onerror = () => {
+                    URL.revokeObjectURL(url);
+                    done(new Error('Could not decode tile'), tile);
+                };
+                tile.src = url;
+            }).catch(error => done(error, tile));
+            return tile;
+        }
+    });
+</script>"""
+MBTILES_LAYER_TEMPLATE = "new MBTilesLayer('{tile_url}', L.extend(" + LAYER_OPTIONS + ", {{ contentType: '{content_type}' }}))"
+
+# MODIFIED: This function now uses the user-provided static HTML as a template.
+def create_static_html_viewer(tile_url, tms_scheme=False, source='files', html_path='index.html',
+                              tile_format='png'):
+    """
+    Creates a static HTML viewer, index.html in the current directory by default.
+    tile_url is the Leaflet URL template the viewer loads tiles from, or the
+    archive URL when source is 'pmtiles' or 'mbtiles'.
+    """
+    if source == 'pmtiles':
+        extra_scripts = PMTILES_SCRIPTS
+        tile_layer = PMTILES_LAYER_TEMPLATE.format(tile_url=tile_url)
+    elif source == 'mbtiles':
+        extra_scripts = MBTILES_SCRIPTS
+        content_type = TILE_CONTENT_TYPES.get(tile_format, 'application/octet-stream')
+        tile_layer = MBTILES_LAYER_TEMPLATE.format(tile_url=tile_url, content_type=content_type)
+    else:
+        extra_scripts = ''
+        tile_layer = TILE_LAYER_TEMPLATE.format(tile_url=tile_url, tms='true' if tms_scheme else 'false')
+    html_content = HTML_TEMPLATE.format(extra_scripts=extra_scripts, tile_layer=tile_layer)
+
     try:
         with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(html_content.strip())
+            f.write(html_content)
         print(f"Success: Created map viewer at '{os.path.abspath(html_path)}'")
     except Exception as e:
-        print(f"Error: Could not create index.html file. Reason: {e}")
+        print(f"Error: Could not create {html_path} file. Reason: {e}")
+
+def has_dedup_schema(cur):
+    """
+    Checks whether the MBTiles file stores distinct tile images once, in the
+    'images' table, with 'map' pointing each tile at one of them.
+    """
+    return cur.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' "
+                       "AND name IN ('map', 'images')").fetchone()[0] == 2
+
+def make_tile_dir(output_dir, parts, created_dirs, lock):
+    """
+    Creates output_dir/<parts...> unless this run already did, and returns
+    its path with a trailing separator for appending file names.
+    """
+    tile_dir = os.path.join(output_dir, *map(str, parts))
+    if parts not in created_dirs:
+        with lock:
+            if parts not in created_dirs:
+                os.makedirs(tile_dir, exist_ok=True)
+                created_dirs.add(parts)
+    return tile_dir + os.sep
+
+def write_file(path, data):
+    """
+    Writes data to a new file at path, replacing any file already there.
+    """
+    # Tiles are written in one go, so skip the buffered file object entirely
+    try:
+        fd = os.open(path, TILE_OPEN_FLAGS, 0o644)
+    except FileExistsError: # Replace the old file instead of writing into it
+        os.unlink(path)
+        fd = os.open(path, TILE_OPEN_FLAGS, 0o644)
+    try:
+        data = memoryview(data)
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+def dedup_image_dir(image_id):
+    """
+    Returns the DEDUP_DIR subdirectory, as path parts, holding an image;
+    images are bucketed 1024 to a directory.
+    """
+    return (DEDUP_DIR, image_id >> 10)
 
-def extract_tiles(db_file, output_dir, tms_scheme=False):
+def write_tiles(output_dir, tile_format, rows, created_dirs, lock):
+    """
+    Writes a batch of (zoom, x, y, tile_data) rows to disk.
+    """
+    suffix = f".{tile_format}"
+    key = None
+    for zoom, x, y, tile_data in rows:
+        # Rows are sorted by zoom and column, so the directory only changes
+        # between runs of tiles and its path is built once per run.
+        if (zoom, x) != key:
+            key = (zoom, x)
+            prefix = make_tile_dir(output_dir, key, created_dirs, lock)
+        write_file(f"{prefix}{y}{suffix}", tile_data)
+
+def write_images(output_dir, tile_format, rows, created_dirs, lock):
+    """
+    Writes a batch of (image_id, tile_data) rows from the 'images' table of a
+    deduplicated MBTiles into DEDUP_DIR.
+    """
+    suffix = f".{tile_format}"
+    key = None
+    for image_id, tile_data in rows:
+        if dedup_image_dir(image_id) != key:
+            key = dedup_image_dir(image_id)
+            prefix = make_tile_dir(output_dir, key, created_dirs, lock)
+        write_file(f"{prefix}{image_id}{suffix}", tile_data)
+
+def link_tiles(output_dir, tile_format, rows, created_dirs, lock):
+    """
+    Hard-links a batch of (zoom, x, y, image_id) rows to the images that
+    write_images() put under DEDUP_DIR.
+    """
+    suffix = f".{tile_format}"
+    key = None
+    for zoom, x, y, image_id in rows:
+        if (zoom, x) != key:
+            key = (zoom, x)
+            prefix = make_tile_dir(output_dir, key, created_dirs, lock)
+        tile_path = f"{prefix}{y}{suffix}"
+        image_path = os.path.join(output_dir, *map(str, dedup_image_dir(image_id)), f"{image_id}{suffix}")
+        try:
+            os.link(image_path, tile_path)
+        except FileExistsError:
+            os.unlink(tile_path)
+            os.link(image_path, tile_path)
+        except OSError: # File system without hard links
+            shutil.copyfile(image_path, tile_path)
+
+def query_tiles(cur, tms_scheme=False, zoom=None, dedup=False):
+    """
+    Runs the tile query on cur, for one zoom level or for all of them.
+    Rows come back as (zoom, x, y, tile_data) with y already in the output scheme.
+    With dedup=True they are read from 'map' as (zoom, x, y, image_id) for
+    link_tiles(), image_id being the rowid of the tile's row in 'images'.
+    """
+    # Write each zoom/column directory in one contiguous burst. MBTiles files
+    # normally carry a unique (zoom_level, tile_column, tile_row) index, so
+    # SQLite can walk it instead of sorting. The TMS to XYZ row flip is also
+    # done by SQLite so the write loop doesn't branch.
+    if tms_scheme:
+        y_column = "tile_row"
+    else:
+        y_column = "((1 << zoom_level) - 1) - tile_row"
+    if dedup:
+        source = "images.rowid FROM map JOIN images ON images.tile_id = map.tile_id"
+    else:
+        source = "tile_data FROM tiles"
+    where = "" if zoom is None else "WHERE zoom_level = ? "
+    cur.execute(f"SELECT zoom_level, tile_column, {y_column}, {source} {where}"
+                "ORDER BY zoom_level, tile_column, tile_row", () if zoom is None else (zoom,))
+
+def query_dedup_images(cur):
+    """
+    Runs the query for write_images() on cur: every distinct image of a
+    deduplicated MBTiles as (image_id, tile_data).
+    """
+    cur.execute("SELECT rowid, tile_data FROM images ORDER BY rowid")
+
+def write_tile_rows(cur, output_dir, tile_format, workers=DEFAULT_WORKERS, progress=None,
+                    writer=write_tiles):
+    """
+    Writes out every row of an executed query using a pool of threads, with
+    writer (write_tiles, write_images or link_tiles) handling each batch.
+    Returns the number of rows written.
+    """
+    created_dirs = set() # (zoom, x) pairs whose directory already exists
+    dirs_lock = threading.Lock()
+    # Keep every worker busy without reading far ahead of the disk
+    pending = threading.BoundedSemaphore(workers * 2)
+    errors = []
+    written = 0
+
+    def on_written(future):
+        pending.release()
+        if future.exception() is not None:
+            errors.append(future.exception())
+
+    cur.arraysize = FETCH_BATCH_SIZE
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while not errors:
+            rows = cur.fetchmany()
+            if not rows:
+                break
+            pending.acquire()
+            future = pool.submit(writer, output_dir, tile_format, rows,
+                                 created_dirs, dirs_lock)
+            future.add_done_callback(on_written)
+            written += len(rows)
+            if progress is not None:
+                progress.update(len(rows))
+    if errors:
+        raise errors[0]
+    return written
+
+def extract_zoom(db_file, output_dir, tile_format, tms_scheme, workers, dedup, zoom):
+    """
+    Extracts a single zoom level over its own connection, for use in a worker process.
+    Returns the number of tiles written.
+    """
+    conn = connect_mbtiles(db_file)
+    try:
+        cur = conn.cursor()
+        query_tiles(cur, tms_scheme, zoom, dedup)
+        return write_tile_rows(cur, output_dir, tile_format, workers,
+                               writer=link_tiles if dedup else write_tiles)
+    finally:
+        conn.close()
+
+def extract_tiles(db_file, output_dir, tms_scheme=False, workers=DEFAULT_WORKERS, processes=1):
     """
     Extracts tiles from an MBTiles file and creates an HTML viewer.
+    With processes > 1, zoom levels are extracted in parallel worker processes.
     """
     conn = None # Initialize conn to None
     try:
-        conn = sqlite3.connect(db_file)
+        conn = connect_mbtiles(db_file)
         cur = conn.cursor()
+        # Read everything from a single snapshot instead of re-locking per query
+        cur.execute("BEGIN")
 
         tile_format = get_tile_format(cur)
         print(f"Detected tile format: .{tile_format}")
 
-        cur.execute("SELECT COUNT(*) FROM tiles")
-        count = cur.fetchone()[0]
-        if count == 0:
+        # Check for real rows; the count below may come from stale metadata
+        if cur.execute("SELECT 1 FROM tiles LIMIT 1").fetchone() is None:
             print("No tiles to extract.")
             return
         
+        count = get_tile_count(cur)
         print(f"Found {count} tiles to extract.")
-        cur.execute("SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles")
-        
         start_time = time.time()
-        for row in tqdm(cur, total=count, desc="Extracting Tiles"):
-            zoom, x, y, tile_data = row
-            
-            if not tms_scheme:
-                y = (2**zoom - 1) - y
-
-            tile_dir = os.path.join(output_dir, str(zoom), str(x))
-            os.makedirs(tile_dir, exist_ok=True)
-            
-            tile_path = os.path.join(tile_dir, f"{y}.{tile_format}")
-            with open(tile_path, 'wb') as f:
-                f.write(tile_data)
+
+        # Deduplicated MBTiles: write each distinct image once, then hard-link
+        # every tile to its image instead of writing the same bytes again.
+        dedup = has_dedup_schema(cur)
+        if dedup:
+            image_count = cur.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+            print(f"Tiles share {image_count} distinct images, linking duplicates.")
+            with tqdm(total=image_count, desc="Writing Images", mininterval=0.5) as progress:
+                query_dedup_images(cur)
+                write_tile_rows(cur, output_dir, tile_format, workers, progress, write_images)
+
+        with tqdm(total=count, desc="Extracting Tiles", mininterval=0.5) as progress:
+            if processes > 1:
+                # Deepest zooms hold most of the tiles, so start them first
+                cur.execute(f"SELECT DISTINCT zoom_level FROM {'map' if dedup else 'tiles'} ORDER BY zoom_level DESC")
+                zooms = [row[0] for row in cur.fetchall()]
+                extract = partial(extract_zoom, db_file, output_dir, tile_format, tms_scheme, workers, dedup)
+                with multiprocessing.Pool(min(len(zooms), processes)) as pool:
+                    for written in pool.imap_unordered(extract, zooms):
+                        progress.update(written)
+            else:
+                query_tiles(cur, tms_scheme, dedup=dedup)
+                write_tile_rows(cur, output_dir, tile_format, workers, progress,
+                                link_tiles if dedup else write_tiles)
+        conn.commit()
         
         end_time = time.time()
         print(f"\nExtraction complete. Time taken: {end_time - start_time:.2f} seconds.")
 
         # MODIFIED: Call the new static HTML creator
-        create_static_html_viewer(output_dir, tile_format)
+        tile_folder_name = os.path.basename(output_dir)
+        create_static_html_viewer(f"{tile_folder_name}/{{z}}/{{x}}/{{y}}.{tile_format}", tms_scheme)
+
+    except sqlite3.OperationalError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+def pack_pmtiles(db_file, output_file):
+    """
+    Packs the tiles of an MBTiles file into a single PMTiles archive and
+    creates an HTML viewer for it.
+    """
+    try:
+        from pmtiles.convert import mbtiles_to_header_json
+        from pmtiles.tile import zxy_to_tileid, tileid_to_zxy
+        from pmtiles.writer import write
+    except ImportError:
+        print("Error: --pack pmtiles needs the 'pmtiles' package (pip install pmtiles).")
+        return
+
+    conn = None
+    try:
+        conn = connect_mbtiles(db_file)
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+
+        tile_format = get_tile_format(cur)
+        print(f"Detected tile format: .{tile_format}")
+        try:
+            metadata = dict(cur.execute("SELECT name, value FROM metadata").fetchall())
+        except sqlite3.OperationalError:
+            metadata = {} # Filled in from the tiles below
+
+        # PMTiles readers expect tile data in Hilbert (tile id) order, which
+        # SQLite can't produce, so sort the ids first and then look each tile
+        # up through the (zoom_level, tile_column, tile_row) index.
+        cur.execute("SELECT zoom_level, tile_column, ((1 << zoom_level) - 1) - tile_row FROM tiles")
+        tile_ids = sorted(zxy_to_tileid(zoom, x, y) for zoom, x, y in cur)
+        if not tile_ids:
+            print("No tiles to extract.")
+            return
+
+        print(f"Found {len(tile_ids)} tiles to pack.")
+        start_time = time.time()
+        is_pbf = tile_format == 'pbf'
+        with write(output_file) as writer:
+            for tile_id in tqdm(tile_ids, desc="Packing Tiles", mininterval=0.5):
+                zoom, x, y = tileid_to_zxy(tile_id)
+                tile_data = cur.execute(SELECT_TILE, (zoom, x, ((1 << zoom) - 1) - y)).fetchone()[0]
+                # PMTiles vector archives are always gzipped
+                if is_pbf and tile_data[:2] != b'\x1f\x8b':
+                    tile_data = gzip.compress(tile_data, mtime=0)
+                writer.write_tile(tile_id, tile_data)
+
+            metadata['format'] = 'jpeg' if tile_format == 'jpg' else tile_format
+            metadata.setdefault('minzoom', tileid_to_zxy(tile_ids[0])[0])
+            metadata.setdefault('maxzoom', tileid_to_zxy(tile_ids[-1])[0])
+            header, metadata = mbtiles_to_header_json(metadata)
+            writer.finalize(header, metadata)
+        conn.commit()
+
+        end_time = time.time()
+        print(f"\nPacking complete. Time taken: {end_time - start_time:.2f} seconds.")
+
+        # The viewer sits in the current directory, so link the archive relative to it
+        archive_url = urllib.request.pathname2url(os.path.relpath(output_file))
+        create_static_html_viewer(archive_url, source='pmtiles')
+        print("Note: open the viewer through a web server that supports HTTP range requests.")
 
     except sqlite3.OperationalError as e:
         print(f"Error: {e}")
@@ -137,22 +521,170 @@ def extract_tiles(db_file, output_dir, tms_scheme=False):
         if conn:
             conn.close()
 
+def create_mbtiles_viewer(db_file):
+    """
+    Creates an HTML viewer that reads tiles from the MBTiles file itself, in
+    the browser, without extracting anything.
+    """
+    conn = None
+    try:
+        conn = connect_mbtiles(db_file)
+        tile_format = get_tile_format(conn.cursor())
+        print(f"Detected tile format: .{tile_format}")
+    except sqlite3.Error as e:
+        print(f"Error: {e}")
+        return
+    finally:
+        if conn:
+            conn.close()
+
+    # The viewer sits in the current directory, so link the file relative to it
+    db_url = urllib.request.pathname2url(os.path.relpath(db_file))
+    create_static_html_viewer(db_url, source='mbtiles', tile_format=tile_format)
+    print("Note: the browser loads the whole file into memory, and most browsers only "
+          "allow it when the viewer is opened through a web server.")
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves /{z}/{x}/{y}.{ext} straight out of the MBTiles file.
+    Each client connection is handled on its own thread with its own
+    SQLite connection.
+    """
+    protocol_version = "HTTP/1.1" # Keep-alive, so one connection serves many tiles
+    tile_path_re = re.compile(r"^/(\d+)/(\d+)/(\d+)\.\w+$")
+
+    def setup(self):
+        super().setup()
+        self.conn = connect_mbtiles(self.server.db_file)
+
+    def finish(self):
+        super().finish()
+        self.conn.close()
+
+    def do_GET(self):
+        match = self.tile_path_re.match(self.path.split('?', 1)[0])
+        if not match:
+            self.send_error(404)
+            return
+
+        zoom, x, y = (int(v) for v in match.groups())
+        # Reject coordinates no tile can have before they reach SQLite
+        if zoom > MAX_ZOOM or x >= 1 << zoom or y >= 1 << zoom:
+            self.send_error(404)
+            return
+        if not self.server.tms_scheme:
+            y = ((1 << zoom) - 1) - y
+        row = self.conn.execute(SELECT_TILE, (zoom, x, y)).fetchone()
+        if row is None:
+            self.send_error(404)
+            return
+
+        tile_data = row[0]
+        self.send_response(200)
+        self.send_header("Content-Type", TILE_CONTENT_TYPES.get(self.server.tile_format, "application/octet-stream"))
+        if tile_data[:2] == b'\x1f\x8b': # Vector tiles are usually stored gzipped
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(tile_data)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(tile_data)
+
+def serve_tiles(db_file, port=DEFAULT_PORT, tms_scheme=False):
+    """
+    Serves tiles directly from an MBTiles file over HTTP instead of extracting them.
+    """
+    conn = None
+    try:
+        conn = connect_mbtiles(db_file)
+        cur = conn.cursor()
+        tile_format = get_tile_format(cur)
+        print(f"Detected tile format: .{tile_format}")
+        # Fail here, not on every request, if there is nothing to serve
+        if cur.execute("SELECT 1 FROM tiles LIMIT 1").fetchone() is None:
+            print("No tiles to serve.")
+            return
+    except sqlite3.Error as e:
+        print(f"Error: {e}")
+        return
+    finally:
+        if conn:
+            conn.close()
+
+    try:
+        server = ThreadingHTTPServer(("localhost", port), TileRequestHandler)
+    except OSError as e:
+        print(f"Error: Could not listen on port {port}. Reason: {e}")
+        return
+    server.daemon_threads = True
+    server.db_file = db_file
+    server.tile_format = tile_format
+    server.tms_scheme = tms_scheme
+
+    create_static_html_viewer(f"http://localhost:{port}/{{z}}/{{x}}/{{y}}.{tile_format}", tms_scheme)
+    print(f"Serving tiles at http://localhost:{port}/ (press Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+    finally:
+        server.server_close()
+
+def positive_int(value):
+    """Argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 def main():
     """Main function to parse arguments and run the extraction."""
     parser = argparse.ArgumentParser(description="Extracts tiles from an MBTiles file and creates an HTML viewer.")
     parser.add_argument("input_file", help="Path to the input .mbtiles file.")
     parser.add_argument("-o", "--output", help="Path to the output directory. Defaults to a folder named after the input file.")
     parser.add_argument("--tms", action="store_true", help="Use TMS y-coordinate scheme instead of the default XYZ.")
+    parser.add_argument("-j", "--workers", type=positive_int, default=DEFAULT_WORKERS, help=f"Number of threads writing tiles to disk. Defaults to {DEFAULT_WORKERS}.")
+    parser.add_argument("-p", "--processes", type=positive_int, default=1, help="Number of processes extracting zoom levels in parallel, each with its own --workers threads. Defaults to 1.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port for --serve. Defaults to {DEFAULT_PORT}.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--serve", action="store_true", help="Serve tiles straight from the MBTiles file over HTTP instead of extracting them.")
+    mode.add_argument("--no-extract", action="store_true", help="Only create a viewer that reads tiles from the MBTiles file in the browser.")
+    mode.add_argument("--pack", choices=["pmtiles"], help="Write all tiles into one archive of this format instead of one file per tile. -o then names the archive file.")
     args = parser.parse_args()
 
+    if (args.serve or args.no_extract) and args.output:
+        parser.error("-o/--output cannot be used with --serve or --no-extract")
+    if (args.serve or args.no_extract or args.pack) and args.processes != 1:
+        parser.error("-p/--processes only applies when extracting to a directory")
+
     if not os.path.isfile(args.input_file):
         print(f"Error: Input file not found at '{args.input_file}'")
         sys.exit(1)
 
+    if args.serve:
+        print(f"Input file: {args.input_file}")
+        serve_tiles(args.input_file, args.port, args.tms)
+        return
+
+    if args.no_extract:
+        print(f"Input file: {args.input_file}")
+        create_mbtiles_viewer(args.input_file)
+        return
+
+    base_name = os.path.basename(args.input_file)
+    file_name_without_ext = os.path.splitext(base_name)[0]
+
+    if args.pack == 'pmtiles':
+        output_file = args.output or f"{file_name_without_ext}.pmtiles"
+        print(f"Input file: {args.input_file}")
+        print(f"Output file: {output_file}")
+        output_parent = os.path.dirname(output_file)
+        if output_parent:
+            os.makedirs(output_parent, exist_ok=True)
+        pack_pmtiles(args.input_file, output_file)
+        return
+
     output_dir = args.output
     if not output_dir:
-        base_name = os.path.basename(args.input_file)
-        file_name_without_ext = os.path.splitext(base_name)[0]
         output_dir = f"{file_name_without_ext}_tiles"
 
     print(f"Input file: {args.input_file}")
@@ -164,7 +696,7 @@ def main():
         
     os.makedirs(output_dir, exist_ok=True)
 
-    extract_tiles(args.input_file, output_dir, args.tms)
+    extract_tiles(args.input_file, output_dir, args.tms, args.workers, args.processes)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file